@@ -3,51 +3,59 @@
 import serial
 import time
 import sys
+import threading
+import concurrent.futures
 
-def test_esp32_direct(port, baud_rate=115200):
-    print(f"Testing {port} at {baud_rate} baud...")
+_print_lock = threading.Lock()
+
+def log(port, message):
+    with _print_lock:
+        print(f"[{port}] {message}")
+
+def test_esp32_direct(port, baud_rate=921600):
+    log(port, f"Testing at {baud_rate} baud...")
     
     try:
-        ser = serial.Serial(port, baud_rate, timeout=2)
+        ser = serial.Serial(port, baud_rate, timeout=0.2)
+        try:
+            ser.set_low_latency_mode(True)
+        except (IOError, ValueError, AttributeError, NotImplementedError):
+            pass
         time.sleep(3)
         
-        print(f"Connected to {port}")
+        log(port, "Connected")
         
         ser.flushInput()
         ser.flushOutput()
         
-        print("Sending 'OPEN' command...")
+        log(port, "Sending 'OPEN' command...")
         ser.write(b"OPEN\n")
         ser.flush()
         
-        time.sleep(1)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-            print(f"ESP32 Response: {response}")
+        response = ser.read_until(b"\n").decode('utf-8', errors='ignore').strip()
+        if response:
+            log(port, f"ESP32 Response: {response}")
         else:
-            print("No response from ESP32")
+            log(port, "No response from ESP32")
         
-        print("Sending 'FIST' command...")
+        log(port, "Sending 'FIST' command...")
         ser.write(b"FIST\n")
         ser.flush()
         
-        time.sleep(1)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-            print(f"ESP32 Response: {response}")
+        response = ser.read_until(b"\n").decode('utf-8', errors='ignore').strip()
+        if response:
+            log(port, f"ESP32 Response: {response}")
         else:
-            print("No response from ESP32")
+            log(port, "No response from ESP32")
         
         ser.close()
         return True
         
     except serial.SerialException as e:
-        print(f"Serial error: {e}")
+        log(port, f"Serial error: {e}")
         return False
     except Exception as e:
-        print(f"Error: {e}")
+        log(port, f"Error: {e}")
         return False
 
 def main():
@@ -62,15 +70,21 @@ def main():
     
     success = False
     
-    for port in test_ports:
-        print(f"\nTesting {port}...")
-        if test_esp32_direct(port):
+    print(f"\nTesting {len(test_ports)} ports in parallel...")
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(test_ports))
+    futures = {executor.submit(test_esp32_direct, port): port for port in test_ports}
+    
+    for future in concurrent.futures.as_completed(futures):
+        port = futures[future]
+        if future.result():
             success = True
             print(f"SUCCESS! ESP32 is responding on {port}")
             break
         else:
             print(f"No response from {port}")
     
+    executor.shutdown(wait=False, cancel_futures=True)
+    
     if not success:
         print("\nNo ESP32 communication found.")
         print("\nTroubleshooting steps:")
@@ -12,11 +12,11 @@ String receivedCommand = "";
 bool commandComplete = false;
 
 void setup() {
-  Serial.begin(115200);
+  Serial.begin(921600);
   myServo.attach(servoPin);
   myServo.write(OPEN_POSITION);
-  Serial.println("Ready");
   delay(1000);
+  Serial.println("Ready");
 }
 
 void loop() {
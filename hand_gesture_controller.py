@@ -2,35 +2,164 @@
 
 import cv2
 import mediapipe as mp
+import numpy as np
 import serial
 import time
 import sys
+import os
+import glob
+import queue
+import threading
+import collections
 from typing import List, Tuple, Optional
+from mediapipe.framework.formats import landmark_pb2
+from mediapipe.tasks import python as mp_tasks
+from mediapipe.tasks.python import vision
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hand_landmarker.task")
+
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+TOLERANCE_PIXELS = 10
+REQUIRED_FINGERS = 3
+OVERLAY_HEIGHT = 125
+
+COMMAND_BYTES = {"OPEN": b"OPEN\n", "FIST": b"FIST\n"}
+
+SERVO_TRANSITIONS = {
+    ("UNKNOWN", "FIST"): "FIST",
+    ("UNKNOWN", "OPEN"): "OPEN",
+    ("OPEN", "FIST"): "FIST",
+    ("FIST", "OPEN"): "OPEN",
+}
+
+def _classify_landmarks(lm_xyz, tip_idx, mcp_idx, axis, scale):
+    closed_fingers = 0
+    for i in range(5):
+        if lm_xyz[tip_idx[i], axis[i]] * scale[i] > lm_xyz[mcp_idx[i], axis[i]] * scale[i] - TOLERANCE_PIXELS:
+            closed_fingers += 1
+    return closed_fingers, closed_fingers >= REQUIRED_FINGERS
+
+try:
+    from numba import njit
+    _classify_landmarks_jit = njit(cache=True, nogil=True, fastmath=True)(_classify_landmarks)
+except ImportError:
+    _classify_landmarks_jit = None
+
+class _CaptureThread:
+    def __init__(self, cap):
+        self.cap = cap
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Event()
+        self.frame = None
+        self.frame_skip = 1
+        self.decode_every = 1
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def _run(self):
+        frame_idx = 0
+        while not self.stopped:
+            if not self.cap.grab():
+                print("Camera error")
+                self.stopped = True
+                break
+            
+            frame_idx += 1
+            skip = self.decode_every
+            if frame_idx % skip:
+                continue
+            
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            
+            with self.lock:
+                self.frame = frame
+                self.frame_skip = skip
+                self.frame_ready.set()
+    
+    def read(self, timeout: float = 0.1):
+        if not self.frame_ready.wait(timeout):
+            return None, 0
+        
+        with self.lock:
+            frame = self.frame
+            skip = self.frame_skip
+            self.frame = None
+            self.frame_ready.clear()
+        return frame, skip
+    
+    def stop(self):
+        self.stopped = True
+        if self.thread.is_alive():
+            self.thread.join(timeout=1)
 
 class HandGestureController:
-    def __init__(self, serial_port: str = None, baud_rate: int = 115200):
+    def __init__(self, serial_port: str = None, baud_rate: int = 921600, model_path: str = None):
         self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=1,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.5
-        )
+        self.hands = None
+        self.landmarker = None
+        self._timestamp_ms = 0
+        
+        if model_path:
+            try:
+                self.landmarker = self.create_landmarker(model_path)
+                print("Using MediaPipe GPU hand landmarker")
+            except (RuntimeError, NotImplementedError) as e:
+                print(f"GPU landmarker unavailable: {e}")
+        
+        if self.landmarker is None:
+            self.hands = self.mp_hands.Hands(
+                static_image_mode=False,
+                max_num_hands=1,
+                model_complexity=0,
+                min_detection_confidence=0.6,
+                min_tracking_confidence=0.5
+            )
         self.mp_drawing = mp.solutions.drawing_utils
         
-        self.cap = cv2.VideoCapture(0)
+        if sys.platform.startswith('win'):
+            capture_backend = cv2.CAP_DSHOW
+        elif sys.platform.startswith('linux'):
+            capture_backend = cv2.CAP_V4L2
+        else:
+            capture_backend = cv2.CAP_ANY
+        self.cap = cv2.VideoCapture(0, capture_backend)
         
         if not self.cap.isOpened():
             raise RuntimeError("Camera not available")
         
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        mjpg = cv2.VideoWriter_fourcc(*'MJPG')
+        self.cap.set(cv2.CAP_PROP_FOURCC, mjpg)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
         self.cap.set(cv2.CAP_PROP_FPS, 30)
+        if not self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+            print("Camera backend ignores buffer size")
+        if int(self.cap.get(cv2.CAP_PROP_FOURCC)) != mjpg:
+            print("MJPG not supported, using default camera format")
+        self.inference_size = (320, 240)
+        inference_width, inference_height = self.inference_size
+        self._small_buf = np.empty((inference_height, inference_width, 3), dtype=np.uint8)
+        self._rgb_buf = np.empty((inference_height, inference_width, 3), dtype=np.uint8)
+        
+        self.max_cache_hits = 5
+        self._last_hash = None
+        self._cached_hands = []
+        self._cache_hits = 0
         
         self.serial_connection = None
         if serial_port:
             try:
                 self.serial_connection = serial.Serial(serial_port, baud_rate, timeout=1)
+                try:
+                    self.serial_connection.set_low_latency_mode(True)
+                except (IOError, ValueError, AttributeError, NotImplementedError):
+                    pass
                 time.sleep(2)
                 print(f"Connected to {serial_port}")
             except serial.SerialException as e:
@@ -44,102 +173,110 @@ class HandGestureController:
         self.last_stable_gesture = "UNKNOWN"
         self.gesture_changed = False
         
-        self.gesture_history = []
         self.history_size = 5
+        self.gesture_history = collections.deque(maxlen=self.history_size)
+        self.gesture_counts = {"FIST": 0, "OPEN": 0, "UNKNOWN": 0}
         self.fist_threshold = 0.6
         
         self.servo_hold_timer = 0
         self.hold_delay = 20
+        self.hold_frame_skip = 4
+        
+        self.display_every = 2
+        self._frame_count = 0
+        self._overlay_key = None
+        self._overlay = None
+        self._overlay_mask = None
+        self._display_buf = None
+        
+        self.fingertips = (4, 8, 12, 16, 20)
+        self.mcp_joints = (3, 6, 10, 14, 18)
+        self._tip_idx = np.array(self.fingertips, dtype=np.intp)
+        self._mcp_idx = np.array(self.mcp_joints, dtype=np.intp)
+        self._axis = np.array([0, 1, 1, 1, 1], dtype=np.intp)
+        self._scale = np.array([-FRAME_WIDTH] + [FRAME_HEIGHT] * 4, dtype=np.float32)
+        if _classify_landmarks_jit is not None:
+            self._classify(np.zeros((21, 2), dtype=np.float32))
         
-        self.fingertips = [4, 8, 12, 16, 20]
-        self.mcp_joints = [3, 6, 10, 14, 18]
+        self.capture = _CaptureThread(self.cap)
+        self._results = queue.Queue(maxsize=1)
+        self._stop_event = threading.Event()
+        self._infer_thread = threading.Thread(target=self._infer_loop, daemon=True)
+        
+        self._tx_queue = queue.Queue()
+        self._tx_thread = None
+        if self.serial_connection:
+            self._tx_thread = threading.Thread(target=self._tx_loop, daemon=True)
+            self._tx_thread.start()
     
-    def detect_fist(self, landmarks) -> bool:
-        if not landmarks:
-            return False
+    def create_landmarker(self, model_path: str):
+        options = vision.HandLandmarkerOptions(
+            base_options=mp_tasks.BaseOptions(
+                model_asset_path=model_path,
+                delegate=mp_tasks.BaseOptions.Delegate.GPU
+            ),
+            running_mode=vision.RunningMode.VIDEO,
+            num_hands=1,
+            min_hand_detection_confidence=0.6,
+            min_tracking_confidence=0.5
+        )
+        return vision.HandLandmarker.create_from_options(options)
+    
+    def detect_hands(self, rgb_frame):
+        if self.landmarker is None:
+            results = self.hands.process(rgb_frame)
+            return results.multi_hand_landmarks or []
         
-        h, w = 480, 640
-        tolerance_pixels = 10
-        required_fingers = 3
-        closed_fingers = 0
+        self._timestamp_ms = max(self._timestamp_ms + 1, int(time.monotonic() * 1000))
+        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+        result = self.landmarker.detect_for_video(mp_image, self._timestamp_ms)
         
-        for i in range(len(self.fingertips)):
-            fingertip_idx = self.fingertips[i]
-            mcp_idx = self.mcp_joints[i]
-            
-            fingertip = landmarks.landmark[fingertip_idx]
-            mcp = landmarks.landmark[mcp_idx]
-            
-            fingertip_y = int(fingertip.y * h)
-            mcp_y = int(mcp.y * h)
-            
-            finger_closed = False
-            
-            if i == 0:
-                fingertip_x = int(fingertip.x * w)
-                mcp_x = int(mcp.x * w)
-                if fingertip_x > (mcp_x - tolerance_pixels):
-                    finger_closed = True
-            else:
-                if fingertip_y > (mcp_y - tolerance_pixels):
-                    finger_closed = True
-            
-            if finger_closed:
-                closed_fingers += 1
+        hands = []
+        for hand in result.hand_landmarks:
+            hand_proto = landmark_pb2.NormalizedLandmarkList()
+            hand_proto.landmark.extend(
+                landmark_pb2.NormalizedLandmark(x=lm.x, y=lm.y, z=lm.z) for lm in hand)
+            hands.append(hand_proto)
+        return hands
+    
+    def _lm_to_np(self, landmarks):
+        return np.fromiter(
+            (c for lm in landmarks.landmark for c in (lm.x, lm.y)),
+            dtype=np.float32, count=42).reshape(21, 2)
+    
+    def _classify(self, lm_np) -> Tuple[int, bool]:
+        if _classify_landmarks_jit is not None:
+            return _classify_landmarks_jit(
+                lm_np, self._tip_idx, self._mcp_idx, self._axis, self._scale)
+        
+        tip_vals = lm_np[self._tip_idx, self._axis] * self._scale
+        mcp_vals = lm_np[self._mcp_idx, self._axis] * self._scale
         
-        return closed_fingers >= required_fingers
+        closed_fingers = int(np.count_nonzero(tip_vals > mcp_vals - TOLERANCE_PIXELS))
+        return closed_fingers, closed_fingers >= REQUIRED_FINGERS
+    
+    def detect_fist(self, landmarks) -> bool:
+        if not landmarks:
+            return False
+        return self._classify(self._lm_to_np(landmarks))[1]
     
     def count_closed_fingers(self, landmarks) -> int:
         if not landmarks:
             return 0
-        
-        h, w = 480, 640
-        tolerance_pixels = 10
-        closed_fingers = 0
-        
-        for i in range(len(self.fingertips)):
-            fingertip_idx = self.fingertips[i]
-            mcp_idx = self.mcp_joints[i]
-            
-            fingertip = landmarks.landmark[fingertip_idx]
-            mcp = landmarks.landmark[mcp_idx]
-            
-            fingertip_y = int(fingertip.y * h)
-            mcp_y = int(mcp.y * h)
-            
-            finger_closed = False
-            
-            if i == 0:
-                fingertip_x = int(fingertip.x * w)
-                mcp_x = int(mcp.x * w)
-                if fingertip_x > (mcp_x - tolerance_pixels):
-                    finger_closed = True
-            else:
-                if fingertip_y > (mcp_y - tolerance_pixels):
-                    finger_closed = True
-            
-            if finger_closed:
-                closed_fingers += 1
-        
-        return closed_fingers
+        return self._classify(self._lm_to_np(landmarks))[0]
     
     def smooth_gesture(self, raw_gesture):
+        if len(self.gesture_history) == self.history_size:
+            self.gesture_counts[self.gesture_history[0]] -= 1
         self.gesture_history.append(raw_gesture)
-        
-        if len(self.gesture_history) > self.history_size:
-            self.gesture_history.pop(0)
-        
-        if len(self.gesture_history) < 5:
-            return raw_gesture
-        
-        fist_count = self.gesture_history.count("FIST")
-        open_count = self.gesture_history.count("OPEN")
-        unknown_count = self.gesture_history.count("UNKNOWN")
+        self.gesture_counts[raw_gesture] += 1
         
         total_frames = len(self.gesture_history)
+        if total_frames < self.history_size:
+            return raw_gesture
         
-        fist_percentage = fist_count / total_frames
-        open_percentage = open_count / total_frames
+        fist_percentage = self.gesture_counts["FIST"] / total_frames
+        open_percentage = self.gesture_counts["OPEN"] / total_frames
         
         if fist_percentage >= self.fist_threshold:
             return "FIST"
@@ -150,53 +287,120 @@ class HandGestureController:
     
     def send_command(self, command: str):
         if self.serial_connection and self.serial_connection.is_open:
+            self._tx_queue.put(command)
+        else:
+            print(f"Would send: {command}")
+    
+    def _tx_loop(self):
+        stopping = False
+        while not stopping:
+            command = self._tx_queue.get()
+            stopping = command is None
+            while not self._tx_queue.empty():
+                queued = self._tx_queue.get_nowait()
+                if queued is None:
+                    stopping = True
+                else:
+                    command = queued
+            
+            if command is None:
+                continue
+            
             try:
-                self.serial_connection.write(f"{command}\n".encode())
+                self.serial_connection.write(COMMAND_BYTES.get(command) or f"{command}\n".encode())
+                self.serial_connection.flush()
                 print(f"Sent: {command}")
             except serial.SerialException as e:
                 print(f"Error: {e}")
-        else:
-            print(f"Would send: {command}")
+    
+    def _frame_hash(self, image) -> bytes:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA)
+        return np.packbits(thumb > thumb.mean()).tobytes()
     
     def process_frame(self, frame):
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(rgb_frame)
+        cv2.resize(frame, self.inference_size, dst=self._small_buf, interpolation=cv2.INTER_AREA)
+        frame_hash = self._frame_hash(self._small_buf)
+        
+        if frame_hash == self._last_hash and self._cache_hits < self.max_cache_hits:
+            self._cache_hits += 1
+            multi_hand_landmarks = self._cached_hands
+        else:
+            self._rgb_buf.flags.writeable = True
+            cv2.cvtColor(self._small_buf, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+            self._rgb_buf.flags.writeable = False
+            multi_hand_landmarks = self.detect_hands(self._rgb_buf)
+            
+            self._last_hash = frame_hash
+            self._cached_hands = multi_hand_landmarks
+            self._cache_hits = 0
         
         gesture_detected = "UNKNOWN"
         closed_finger_count = 0
         
-        if results.multi_hand_landmarks:
-            for hand_landmarks in results.multi_hand_landmarks:
+        if multi_hand_landmarks:
+            for hand_landmarks in multi_hand_landmarks:
                 self.mp_drawing.draw_landmarks(
                     frame, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
                 
-                closed_finger_count = self.count_closed_fingers(hand_landmarks)
-                if self.detect_fist(hand_landmarks):
-                    gesture_detected = "FIST"
-                else:
-                    gesture_detected = "OPEN"
+                closed_finger_count, is_fist = self._classify(self._lm_to_np(hand_landmarks))
+                gesture_detected = "FIST" if is_fist else "OPEN"
         
         return frame, gesture_detected, closed_finger_count
     
+    def draw_overlay(self, frame, closed_fingers: int):
+        key = (self.current_gesture, closed_fingers, self.servo_position, frame.shape[1])
+        if key != self._overlay_key:
+            self._overlay = np.zeros((OVERLAY_HEIGHT, frame.shape[1], 3), dtype=np.uint8)
+            cv2.putText(self._overlay, f"Hand: {self.current_gesture}", 
+                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.putText(self._overlay, f"Fingers: {closed_fingers}/5", 
+                       (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+            cv2.putText(self._overlay, f"Servo: {self.servo_position}", 
+                       (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+            self._overlay_mask = self._overlay.any(axis=2, keepdims=True)
+            self._overlay_key = key
+        
+        np.copyto(frame[:OVERLAY_HEIGHT], self._overlay, where=self._overlay_mask)
+    
+    def _infer_loop(self):
+        while not self._stop_event.is_set():
+            frame, frame_skip = self.capture.read()
+            if frame is None:
+                if self.capture.stopped:
+                    self._stop_event.set()
+                continue
+            
+            result = self.process_frame(frame) + (frame_skip,)
+            
+            try:
+                self._results.get_nowait()
+            except queue.Empty:
+                pass
+            self._results.put(result)
+    
     def run(self):
         print("Controller Started")
         print("Press 'q' to quit, 'r' to reset")
         
+        self.capture.start()
+        self._infer_thread.start()
+        
         try:
             while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("Camera error")
-                    break
+                try:
+                    processed_frame, raw_gesture, closed_fingers, frame_skip = self._results.get(timeout=0.5)
+                except queue.Empty:
+                    if self._stop_event.is_set():
+                        break
+                    continue
                 
-                frame = cv2.flip(frame, 1)
-                processed_frame, raw_gesture, closed_fingers = self.process_frame(frame)
                 gesture = self.smooth_gesture(raw_gesture)
                 self.current_gesture = gesture
                 
                 if gesture != "UNKNOWN":
                     if self.servo_hold_timer > 0:
-                        self.servo_hold_timer -= 1
+                        self.servo_hold_timer = max(0, self.servo_hold_timer - frame_skip)
                     
                     if self.servo_hold_timer == 0:
                         if gesture != self.last_stable_gesture:
@@ -206,19 +410,13 @@ class HandGestureController:
                                 self.gesture_changed = True
                                 self.last_stable_gesture = gesture
                                 
-                                if gesture == "FIST" and self.servo_position != "FIST":
-                                    self.send_command("FIST")
-                                    self.last_command_sent = "FIST"
-                                    self.servo_position = "FIST"
-                                    self.servo_hold_timer = self.hold_delay
-                                    print("FIST")
-                                    
-                                elif gesture == "OPEN" and self.servo_position != "OPEN":
-                                    self.send_command("OPEN")
-                                    self.last_command_sent = "OPEN"
-                                    self.servo_position = "OPEN"
+                                command = SERVO_TRANSITIONS.get((self.servo_position, gesture))
+                                if command:
+                                    self.send_command(command)
+                                    self.last_command_sent = command
+                                    self.servo_position = command
                                     self.servo_hold_timer = self.hold_delay
-                                    print("OPEN")
+                                    print(command)
                         else:
                             self.gesture_stable_count = 0
                             self.gesture_changed = False
@@ -226,12 +424,18 @@ class HandGestureController:
                     self.gesture_stable_count = 0
                     self.gesture_changed = False
                 
-                cv2.putText(processed_frame, f"Hand: {self.current_gesture}", 
-                           (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                cv2.putText(processed_frame, f"Fingers: {closed_fingers}/5", 
-                           (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-                cv2.putText(processed_frame, f"Servo: {self.servo_position}", 
-                           (10, 110), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+                holding = self.servo_hold_timer > 0 and gesture != "UNKNOWN"
+                self.capture.decode_every = self.hold_frame_skip if holding else 1
+                
+                self._frame_count += 1
+                if self._frame_count % self.display_every:
+                    continue
+                
+                if self._display_buf is None or self._display_buf.shape != processed_frame.shape:
+                    self._display_buf = np.empty_like(processed_frame)
+                cv2.flip(processed_frame, 1, dst=self._display_buf)
+                processed_frame = self._display_buf
+                self.draw_overlay(processed_frame, closed_fingers)
                 
                 cv2.imshow('Hand Controller', processed_frame)
                 
@@ -256,8 +460,19 @@ class HandGestureController:
             self.cleanup()
     
     def cleanup(self):
+        self._stop_event.set()
+        self.capture.stop()
+        if self._infer_thread.is_alive():
+            self._infer_thread.join(timeout=1)
+        
+        if self._tx_thread and self._tx_thread.is_alive():
+            self._tx_queue.put(None)
+            self._tx_thread.join(timeout=1)
+        
         if self.cap:
             self.cap.release()
+        if self.landmarker:
+            self.landmarker.close()
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
         cv2.destroyAllWindows()
@@ -272,9 +487,14 @@ def main():
     print("Hand Controller")
     print("=" * 20)
     
-    available_ports = find_serial_ports()
+    usb_ports = (sorted(glob.glob('/dev/cu.usbserial*')) + sorted(glob.glob('/dev/cu.SLAB_*'))
+                 + sorted(glob.glob('/dev/ttyUSB*')) + sorted(glob.glob('/dev/ttyACM*')))
+    available_ports = [] if usb_ports else find_serial_ports()
     
-    if not available_ports:
+    if usb_ports:
+        serial_port = usb_ports[0]
+        print(f"Using: {serial_port}")
+    elif not available_ports:
         print("No serial ports found")
         serial_port = None
     else:
@@ -290,8 +510,10 @@ def main():
             serial_port = available_ports[0] if available_ports else None
             print(f"Using: {serial_port}")
     
+    model_path = MODEL_PATH if os.path.exists(MODEL_PATH) else None
+    
     try:
-        controller = HandGestureController(serial_port)
+        controller = HandGestureController(serial_port, model_path=model_path)
         controller.run()
     except Exception as e:
         print(f"Error: {e}")
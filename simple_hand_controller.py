@@ -4,19 +4,63 @@ import cv2
 import serial
 import time
 import sys
+import threading
+import queue
 import numpy as np
 from typing import Optional
 
+COMMAND_BYTES = {"OPEN": b"OPEN\n", "FIST": b"FIST\n"}
+
+PYRAMID_LEVELS = 2
+DETECTION_SCALE = 2 ** PYRAMID_LEVELS
+MIN_HAND_AREA = 5000
+OVERLAY_HEIGHT = 85
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+def _skin_mask(bgr, out):
+    rows, cols = out.shape
+    for i in prange(rows):
+        for j in range(cols):
+            b = np.int32(bgr[i, j, 0])
+            g = np.int32(bgr[i, j, 1])
+            r = np.int32(bgr[i, j, 2])
+            mx = max(r, g, b)
+            diff = mx - min(r, g, b)
+            if mx >= 70 and mx == r and diff > 0 and 510 * diff >= 39 * mx and -diff <= 60 * (g - b) < 41 * diff:
+                out[i, j] = 255
+            else:
+                out[i, j] = 0
+
+_skin_mask_jit = njit(parallel=True, cache=True)(_skin_mask) if njit is not None else None
+
 class SimpleHandController:
-    def __init__(self, serial_port: str = None, baud_rate: int = 115200):
+    def __init__(self, serial_port: str = None, baud_rate: int = 921600):
         self.cap = cv2.VideoCapture(0)
         
         if not self.cap.isOpened():
             raise RuntimeError("Camera not available")
         
+        mjpg = cv2.VideoWriter_fourcc(*'MJPG')
+        self.cap.set(cv2.CAP_PROP_FOURCC, mjpg)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
         self.cap.set(cv2.CAP_PROP_FPS, 30)
+        if not self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+            print("Camera backend ignores buffer size")
+        if int(self.cap.get(cv2.CAP_PROP_FOURCC)) != mjpg:
+            print("MJPG not supported, using default camera format")
+        
+        self._frame_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._latest = None
+        self._stop = False
+        self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+        self._reader_thread.start()
         
         self.serial_connection = None
         if serial_port:
@@ -27,59 +71,109 @@ class SimpleHandController:
             except serial.SerialException as e:
                 print(f"Serial error: {e}")
         
+        self.debounce_interval = 0.2
+        self._last_tx_cmd = None
+        self._last_tx_t = 0.0
+        self._tx_queue = queue.Queue(maxsize=32)
+        self._tx_thread = None
+        if self.serial_connection:
+            self._tx_thread = threading.Thread(target=self._tx_loop, daemon=True)
+            self._tx_thread.start()
+        
         self.current_gesture = "UNKNOWN"
         self.last_command_sent = None
         
-        self.hand_cascade = None
-        self.setup_hand_detection()
-        
         self.prev_contours = None
         self.movement_threshold = 1000
         
-    def setup_hand_detection(self):
-        try:
-            self.hand_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_hand.xml')
-            if self.hand_cascade.empty():
-                print("Using contour-based detection")
-                self.hand_cascade = None
-        except:
-            print("Using contour-based detection")
-            self.hand_cascade = None
+        self._se_h = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 1))
+        self._se_v = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 3))
+        self._se_h_wide = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 1))
+        self._se_v_wide = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 5))
+        self._lower_skin = np.array([0, 20, 70], dtype=np.uint8)
+        self._upper_skin = np.array([20, 255, 255], dtype=np.uint8)
+        if _skin_mask_jit is not None:
+            _skin_mask_jit(np.zeros((8, 8, 3), dtype=np.uint8), np.empty((8, 8), dtype=np.uint8))
+        
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        cv2.ocl.setUseOpenCL(self.use_opencl)
+        
+        self.detect_every = 3
+        self._frame_idx = 0
+        self._cached_gesture = "UNKNOWN"
+        self._cached_contour = None
+        
+        self.show_preview = True
+        self.draw_every = 1
+        
+        self.history_size = 20
+        self.fist_threshold = 0.6
+        self._history_mask = (1 << self.history_size) - 1
+        self._history_len = 0
+        self._fist_bits = 0
+        self._open_bits = 0
+        
+        self._overlay_state = None
+        self._overlay = None
+        self._overlay_mask = None
+        
+    def _reader(self):
+        while not self._stop:
+            if not self.cap.grab():
+                print("Camera error")
+                self._stop = True
+                break
+            
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            
+            with self._frame_lock:
+                self._latest = frame
+                self._frame_ready.set()
     
     def detect_hand_gesture(self, frame):
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        small = cv2.UMat(frame) if self.use_opencl else frame
+        for _ in range(PYRAMID_LEVELS):
+            small = cv2.pyrDown(small)
         
-        lower_skin = np.array([0, 20, 70], dtype=np.uint8)
-        upper_skin = np.array([20, 255, 255], dtype=np.uint8)
-        mask = cv2.inRange(hsv, lower_skin, upper_skin)
+        if _skin_mask_jit is not None:
+            if isinstance(small, cv2.UMat):
+                small = small.get()
+            mask = np.empty(small.shape[:2], dtype=np.uint8)
+            _skin_mask_jit(small, mask)
+        else:
+            hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+            mask = cv2.inRange(hsv, self._lower_skin, self._upper_skin)
         
-        kernel = np.ones((5, 5), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+        mask = cv2.erode(mask, self._se_h)
+        mask = cv2.erode(mask, self._se_v)
+        mask = cv2.dilate(mask, self._se_h_wide)
+        mask = cv2.dilate(mask, self._se_v_wide)
+        mask = cv2.erode(mask, self._se_h)
+        mask = cv2.erode(mask, self._se_v)
+        if isinstance(mask, cv2.UMat):
+            mask = mask.get()
         
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if num_labels <= 1:
+            return "UNKNOWN", None
         
-        if not contours:
-            return "UNKNOWN"
+        label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        if stats[label, cv2.CC_STAT_AREA] < MIN_HAND_AREA / (DETECTION_SCALE * DETECTION_SCALE):
+            return "UNKNOWN", None
         
-        largest_contour = max(contours, key=cv2.contourArea)
-        
-        area = cv2.contourArea(largest_contour)
-        if area < 5000:
-            return "UNKNOWN"
+        x, y, w, h = (int(v) for v in stats[label, :4])
+        blob = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+        contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+        largest_contour = contours[0]
         
         gesture = self.analyze_contour(largest_contour)
         
-        cv2.drawContours(frame, [largest_contour], -1, (0, 255, 0), 2)
-        
-        return gesture
+        return gesture, largest_contour
     
     def analyze_contour(self, contour):
-        epsilon = 0.02 * cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, epsilon, True)
-        
         area = cv2.contourArea(contour)
-        perimeter = cv2.arcLength(contour, True)
         
         hull = cv2.convexHull(contour)
         hull_area = cv2.contourArea(hull)
@@ -95,15 +189,60 @@ class SimpleHandController:
         else:
             return "UNKNOWN"
     
+    def smooth_gesture(self, raw_gesture):
+        self._fist_bits = ((self._fist_bits << 1) | (raw_gesture == "FIST")) & self._history_mask
+        self._open_bits = ((self._open_bits << 1) | (raw_gesture == "OPEN")) & self._history_mask
+        self._history_len = min(self._history_len + 1, self.history_size)
+        
+        if self._history_len < self.history_size:
+            return raw_gesture
+        
+        if self._fist_bits.bit_count() / self._history_len >= self.fist_threshold:
+            return "FIST"
+        elif self._open_bits.bit_count() / self._history_len >= self.fist_threshold:
+            return "OPEN"
+        else:
+            return "UNKNOWN"
+    
     def send_command(self, command: str):
+        now = time.monotonic()
+        if command == self._last_tx_cmd and now - self._last_tx_t < self.debounce_interval:
+            return
+        self._last_tx_cmd = command
+        self._last_tx_t = now
+        
         if self.serial_connection and self.serial_connection.is_open:
             try:
-                self.serial_connection.write(f"{command}\n".encode())
+                self._tx_queue.put_nowait(command)
+            except queue.Full:
+                print(f"Dropped: {command}")
+        else:
+            print(f"Would send: {command}")
+    
+    def _tx_loop(self):
+        while True:
+            command = self._tx_queue.get()
+            if command is None:
+                break
+            
+            try:
+                self.serial_connection.write(COMMAND_BYTES.get(command) or f"{command}\n".encode())
                 print(f"Sent: {command}")
             except serial.SerialException as e:
                 print(f"Error: {e}")
-        else:
-            print(f"Would send: {command}")
+    
+    def draw_overlay(self, frame):
+        state = (self.current_gesture, self.last_command_sent, frame.shape[1])
+        if state != self._overlay_state:
+            self._overlay = np.zeros((OVERLAY_HEIGHT, frame.shape[1], 3), dtype=np.uint8)
+            cv2.putText(self._overlay, f"Gesture: {self.current_gesture}", 
+                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.putText(self._overlay, f"Last: {self.last_command_sent or 'None'}", 
+                       (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+            self._overlay_mask = self._overlay.any(axis=2, keepdims=True)
+            self._overlay_state = state
+        
+        np.copyto(frame[:OVERLAY_HEIGHT], self._overlay, where=self._overlay_mask)
     
     def run(self):
         print("Simple Controller Started")
@@ -111,13 +250,29 @@ class SimpleHandController:
         
         try:
             while True:
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("Camera error")
-                    break
+                if not self._frame_ready.wait(0.1):
+                    if self._stop:
+                        break
+                    continue
+                
+                with self._frame_lock:
+                    frame = self._latest
+                    self._latest = None
+                    self._frame_ready.clear()
                 
                 frame = cv2.flip(frame, 1)
-                gesture = self.detect_hand_gesture(frame)
+                self._frame_idx += 1
+                if self._frame_idx % self.detect_every == 0:
+                    gesture, contour = self.detect_hand_gesture(frame)
+                    self._cached_gesture = gesture
+                    self._cached_contour = None if contour is None else contour * DETECTION_SCALE
+                else:
+                    gesture = self._cached_gesture
+                gesture = self.smooth_gesture(gesture)
+                
+                if (self.show_preview and self._cached_contour is not None
+                        and self._frame_idx % self.draw_every == 0):
+                    cv2.drawContours(frame, [self._cached_contour], -1, (0, 255, 0), 2)
                 
                 if gesture != self.current_gesture and gesture != "UNKNOWN":
                     self.current_gesture = gesture
@@ -129,10 +284,7 @@ class SimpleHandController:
                         self.send_command("OPEN")
                         self.last_command_sent = "OPEN"
                 
-                cv2.putText(frame, f"Gesture: {self.current_gesture}", 
-                           (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                cv2.putText(frame, f"Last: {self.last_command_sent or 'None'}", 
-                           (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 0), 2)
+                self.draw_overlay(frame)
                 
                 cv2.imshow('Simple Controller', frame)
                 
@@ -162,6 +314,13 @@ class SimpleHandController:
             self.cleanup()
     
     def cleanup(self):
+        self._stop = True
+        if self._reader_thread.is_alive():
+            self._reader_thread.join(timeout=1)
+        if self._tx_thread and self._tx_thread.is_alive():
+            self._tx_queue.put(None)
+            self._tx_thread.join(timeout=1)
+        
         if self.cap:
             self.cap.release()
         if self.serial_connection and self.serial_connection.is_open:
@@ -170,9 +329,19 @@ class SimpleHandController:
         print("Cleanup completed")
 
 def find_serial_ports():
-    import serial.tools.list_ports
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports]
+    import glob
+    
+    if sys.platform.startswith('linux'):
+        ports = sorted(glob.glob('/dev/ttyUSB*')) + sorted(glob.glob('/dev/ttyACM*'))
+    elif sys.platform == 'darwin':
+        ports = sorted(glob.glob('/dev/cu.usbserial*')) + sorted(glob.glob('/dev/cu.SLAB_*'))
+    else:
+        ports = []
+    
+    if not ports:
+        import serial.tools.list_ports
+        ports = [port.device for port in serial.tools.list_ports.comports()]
+    return ports
 
 def main():
     print("Simple Hand Controller")
@@ -188,13 +357,8 @@ def main():
         for i, port in enumerate(available_ports):
             print(f"{i + 1}. {port}")
         
-        usb_ports = [port for port in available_ports if 'usbserial' in port or 'SLAB' in port]
-        if usb_ports:
-            serial_port = usb_ports[0]
-            print(f"Using: {serial_port}")
-        else:
-            serial_port = available_ports[0] if available_ports else None
-            print(f"Using: {serial_port}")
+        serial_port = available_ports[0]
+        print(f"Using: {serial_port}")
     
     try:
         controller = SimpleHandController(serial_port)
@@ -4,6 +4,22 @@ import subprocess
 import sys
 
 def check_processes():
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    
+    if psutil is not None:
+        mediapipe_running = False
+        simple_running = False
+        for process in psutil.process_iter(['cmdline']):
+            cmdline = ' '.join(process.info['cmdline'] or ())
+            if 'hand_gesture_controller.py' in cmdline:
+                mediapipe_running = True
+            if 'simple_hand_controller.py' in cmdline:
+                simple_running = True
+        return mediapipe_running, simple_running
+    
     try:
         result = subprocess.run(['ps', 'aux'], capture_output=True, text=True)
         lines = result.stdout.split('\n')
@@ -19,7 +35,7 @@ def check_camera():
     try:
         import cv2
         cap = cv2.VideoCapture(0)
-        ret, frame = cap.read()
+        ret = cap.grab()
         cap.release()
         return ret
     except:
@@ -2,48 +2,83 @@
 
 import serial
 import time
+import os
+import select
 import sys
+import threading
+import functools
+import concurrent.futures
 
-def find_serial_ports():
+SERVO_SETTLE_TIME = 0.3
+BOOT_TIMEOUT = 2.0
+TEST_COMMANDS = (b"OPEN\n", b"FIST\n", b"OPEN\n", b"FIST\n", b"OPEN\n")
+PORT_CACHE_SECONDS = 5
+
+_print_lock = threading.Lock()
+
+def log(port, message):
+    with _print_lock:
+        print(f"[{port}] {message}")
+
+ESP32_USB_IDS = {(0x10C4, 0xEA60), (0x1A86, 0x7523)}
+ESP32_USB_VENDORS = {0x0403, 0x303A}
+
+@functools.lru_cache(maxsize=1)
+def _cached_ports(bucket):
     import serial.tools.list_ports
-    ports = serial.tools.list_ports.comports()
-    return [port.device for port in ports]
+    return tuple(serial.tools.list_ports.comports())
+
+def find_serial_ports():
+    return list(_cached_ports(int(time.monotonic() // PORT_CACHE_SECONDS)))
+
+def is_esp32_candidate(port):
+    return (port.vid, port.pid) in ESP32_USB_IDS or port.vid in ESP32_USB_VENDORS
 
-def test_serial_connection(port, baud_rate=115200):
+def write_command(ser, fd, data):
+    if fd is None:
+        ser.write(data)
+        return
+    view = memoryview(data)
+    while view:
+        try:
+            view = view[os.write(fd, view):]
+        except BlockingIOError:
+            select.select([], [fd], [], ser.write_timeout)
+
+def test_serial_connection(port, baud_rate=921600):
     try:
-        ser = serial.Serial(port, baud_rate, timeout=2)
-        time.sleep(2)
+        ser = serial.Serial(port, baud_rate, timeout=BOOT_TIMEOUT)
+        if ser.read_until(b"Ready\r\n", size=1024).endswith(b"Ready\r\n"):
+            log(port, "ESP32 reported ready")
+        ser.timeout = 0.5
+        fd = ser.fileno() if os.name == "posix" else None
         
-        print(f"Connected to {port} at {baud_rate} baud")
-        print("Sending test commands...")
+        log(port, f"Connected at {baud_rate} baud")
+        log(port, "Sending test commands...")
         
-        commands = ["OPEN", "FIST", "OPEN", "FIST", "OPEN"]
-        
-        for i, command in enumerate(commands, 1):
-            print(f"\nTest {i}/5: Sending '{command}'")
-            ser.write(f"{command}\n".encode())
-            
-            time.sleep(1)
+        for i, command in enumerate(TEST_COMMANDS, 1):
+            log(port, f"Test {i}/5: Sending '{command.rstrip().decode()}'")
+            write_command(ser, fd, command)
             
-            if ser.in_waiting:
-                response = ser.readline().decode().strip()
-                print(f"ESP32 response: {response}")
+            response = ser.read_until(b"\n", size=256).decode(errors='ignore').strip()
+            if response:
+                log(port, f"ESP32 response: {response}")
             else:
-                print("No response from ESP32")
+                log(port, "No response from ESP32")
             
-            time.sleep(1)
+            time.sleep(SERVO_SETTLE_TIME)
         
-        print("\nTest completed successfully!")
-        print("If you saw the servo moving, your connection is working!")
+        log(port, "Test completed successfully!")
+        log(port, "If you saw the servo moving, your connection is working!")
         
         ser.close()
         return True
         
     except serial.SerialException as e:
-        print(f"Error connecting to {port}: {e}")
+        log(port, f"Error connecting: {e}")
         return False
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        log(port, f"Unexpected error: {e}")
         return False
 
 def main():
@@ -59,16 +94,28 @@ def main():
     
     print("Available serial ports:")
     for i, port in enumerate(available_ports):
-        print(f"{i + 1}. {port}")
+        print(f"{i + 1}. {port.device}")
     
-    print("\nTesting all available ports...")
+    candidates = [port for port in available_ports if is_esp32_candidate(port)]
+    if candidates:
+        print(f"\n{len(candidates)} port(s) match known ESP32 USB bridges")
+    else:
+        candidates = available_ports
+        print("\nNo known ESP32 USB bridge found, trying every port")
+    
+    print("\nTesting candidate ports in parallel...")
     success = False
-    for port in available_ports:
-        print(f"\nTesting {port}...")
-        if test_serial_connection(port):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(candidates))
+    futures = {executor.submit(test_serial_connection, port.device): port.device for port in candidates}
+    
+    for future in concurrent.futures.as_completed(futures):
+        if future.result():
             success = True
+            print(f"\nWorking connection found on {futures[future]}")
             break
     
+    executor.shutdown(wait=False, cancel_futures=True)
+    
     if not success:
         print("\nNo working connection found.")
         print("Please check:")